@@ -8,7 +8,7 @@ from db_V4 import (
     init_db,
     insert_forecast,
     get_forecasts,
-    insert_metar,
+    insert_metars_bulk,
     get_recent_metars,
     insert_rain_event,
     get_rain_events,
@@ -17,17 +17,64 @@ from db_V4 import (
     get_runway_states,
 )
 from metar_parser_V4 import parse_metar
-from rain_analysis_V4 import (
-    analyze_rain_events,
-    plot_rain_events,
-    plot_rain_runway_timeline,
-    split_wet_runway_episodes,   # ✅ 新增
-)
+
+# rain_analysis_V4 会拉起 matplotlib，只在画图的页面里再导入，
+# 预报 / METAR 页面首次打开时不必加载整套绘图库
 
 st.set_page_config(page_title="昆岛机场气象&跑道记录系统 V4", layout="wide")
 
-# 初始化数据库
-init_db()
+# 初始化数据库（建表只需一次，之后每次重新运行脚本都直接跳过）
+@st.cache_resource
+def _db_ready():
+    init_db()
+    return True
+
+
+_db_ready()
+
+
+# ============================================================
+# 查询缓存：同一时间段反复查询不再访问数据库，保存新记录后清空
+# ============================================================
+@st.cache_data(ttl=60)
+def cached_get_forecasts(start_date, end_date):
+    return get_forecasts(start_date, end_date)
+
+
+@st.cache_data(ttl=60)
+def cached_get_recent_metars(limit=100):
+    return get_recent_metars(limit=limit)
+
+
+@st.cache_data(ttl=60)
+def cached_get_rain_events(start_date, end_date):
+    return get_rain_events(start_date, end_date)
+
+
+@st.cache_data(ttl=60)
+def cached_get_runway_states(start_date, end_date):
+    return get_runway_states(start_date, end_date)
+
+
+# 图表缓存：同样的数据不再重新走 matplotlib 渲染，直接复用 PNG
+@st.cache_data(max_entries=32)
+def cached_timeline_png(rain_df, runway_df):
+    from rain_analysis_V4 import fig_to_png, plot_rain_runway_timeline
+
+    return fig_to_png(plot_rain_runway_timeline(rain_df, runway_df))
+
+
+@st.cache_data(max_entries=32)
+def cached_rain_analysis(df):
+    from rain_analysis_V4 import analyze_rain_events, fig_to_png, plot_rain_events
+
+    events = analyze_rain_events(df)
+    reports = [ev["report"] for ev in events]
+    return reports, fig_to_png(plot_rain_events(events))
+
+
+# 数据库里降水 / 跑道记录的时间格式（查询结果已按时间排好序）
+TIME_FMT = "%Y-%m-%d %H:%M"
 
 
 # ============================================================
@@ -35,26 +82,50 @@ init_db()
 # ============================================================
 def parse_time_numeric(s: str):
     s = (s or "").strip()
-    if not s.isdigit():
-        return None
-    if len(s) == 4:  # HHMM
-        hh, mm = s[:2], s[2:]
-    elif len(s) == 3:  # HMM
-        hh, mm = "0" + s[0], s[1:]
-    elif len(s) == 2:  # MM
-        hh, mm = "00", s
-    elif len(s) == 1:  # M
-        hh, mm = "00", "0" + s
-    else:
+    # 不足 4 位按左补零理解：HMM / MM / M，直接按数值拆出时、分
+    if not s.isdecimal() or len(s) > 4:
         return None
-    try:
-        hh_i = int(hh)
-        mm_i = int(mm)
-        if not (0 <= hh_i <= 23 and 0 <= mm_i <= 59):
-            return None
-    except Exception:
+    hh, mm = divmod(int(s), 100)
+    if not (0 <= hh <= 23 and 0 <= mm <= 59):
         return None
-    return f"{hh}:{mm}"
+    return f"{hh:02d}:{mm:02d}"
+
+
+# ============================================================
+# 通用：METAR 时间 DDHHMMZ → 越南时间 UTC+7
+# ============================================================
+_RE_UTC_TIME = re.compile(r"(\d{2})(\d{2})(\d{2})Z")
+
+
+def to_vn(t):
+    if not isinstance(t, str):
+        return ""
+    m = _RE_UTC_TIME.match(t)
+    if not m:
+        return ""
+    dd, hh, mm = int(m.group(1)), int(m.group(2)), int(m.group(3))
+    hh2 = hh + 7
+    add = 0
+    if hh2 >= 24:
+        hh2 -= 24
+        add = 1
+    return f"{dd+add:02d}日 {hh2:02d}:{mm:02d}"
+
+
+# 整列转换：几百行的查询里逐个调用比 .str 向量化链更快（后者每步都有固定开销）
+def utc_to_vn(col: pd.Series) -> pd.Series:
+    return pd.Series([to_vn(t) for t in col.tolist()], index=col.index, dtype=object)
+
+
+# ============================================================
+# 通用：按 '=' 切出每条报文，逐条产出规范化成一行的文本
+# ============================================================
+def _iter_metars(raw: str):
+    for p in raw.split("="):
+        t = p.strip()
+        if not t:
+            continue
+        yield " ".join(t.split())
 
 
 # ============================================================
@@ -63,35 +134,40 @@ def parse_time_numeric(s: str):
 def page_forecast():
     st.header("📋 昆岛天气预报录入与查询")
 
-    c1, c2 = st.columns(2)
-    with c1:
-        date_val = st.date_input("预报日期")
-    with c2:
-        wind = st.text_input("风向/风速（如 030/05）")
+    with st.form("forecast_form"):
+        c1, c2 = st.columns(2)
+        with c1:
+            date_val = st.date_input("预报日期")
+        with c2:
+            wind = st.text_input("风向/风速（如 030/05）")
 
-    c3, c4 = st.columns(2)
-    with c3:
-        temp_min = st.number_input("最低气温 (℃)", value=25.0, format="%.1f")
-    with c4:
-        temp_max = st.number_input("最高气温 (℃)", value=28.0, format="%.1f")
+        c3, c4 = st.columns(2)
+        with c3:
+            temp_min = st.number_input("最低气温 (℃)", value=25.0, format="%.1f")
+        with c4:
+            temp_max = st.number_input("最高气温 (℃)", value=28.0, format="%.1f")
 
-    weather = st.text_input("天气现象（可自由填写）")
+        weather = st.text_input("天气现象（可自由填写）")
+        submitted = st.form_submit_button("保存预报记录")
 
-    if st.button("保存预报记录"):
+    if submitted:
         insert_forecast(str(date_val), wind, temp_min, temp_max, weather)
+        cached_get_forecasts.clear()
         st.success("✅ 预报记录已保存")
 
     st.markdown("---")
     st.subheader("📑 历史预报查询")
 
-    s1, s2 = st.columns(2)
-    with s1:
-        start = st.date_input("开始日期", key="fc_s")
-    with s2:
-        end = st.date_input("结束日期", key="fc_e")
+    with st.form("forecast_query_form"):
+        s1, s2 = st.columns(2)
+        with s1:
+            start = st.date_input("开始日期", key="fc_s")
+        with s2:
+            end = st.date_input("结束日期", key="fc_e")
+        queried = st.form_submit_button("查询预报记录")
 
-    if st.button("查询预报记录"):
-        rows = get_forecasts(str(start), str(end))
+    if queried:
+        rows = cached_get_forecasts(str(start), str(end))
         if not rows:
             st.info("此时间段无记录")
             return
@@ -105,46 +181,41 @@ def page_forecast():
 def page_metar():
     st.header("🛬 METAR 报文解析（支持一次粘贴多条）")
 
-    raw_block = st.text_area(
-        "输入报文：",
-        height=200,
-        placeholder=(
-            "示例：\n"
-            "Rx 210326Z METAR VVCS 210330Z 07008KT 340V130 9999 SCT015 BKN040 28/24 Q1011 TEMPO 10016G28KT=\n"
-            "Rx 210332Z METAR VVCT 210330Z 01006KT 9999 SCT015 BKN040 27/23 Q1012 NOSIG=\n"
-            "...\n"
-            "仍然按 '=' 作为每条报文结束。"
-        ),
-    )
-
-    if st.button("解析并保存所有报文"):
+    with st.form("metar_form"):
+        raw_block = st.text_area(
+            "输入报文：",
+            height=200,
+            placeholder=(
+                "示例：\n"
+                "Rx 210326Z METAR VVCS 210330Z 07008KT 340V130 9999 SCT015 BKN040 28/24 Q1011 TEMPO 10016G28KT=\n"
+                "Rx 210332Z METAR VVCT 210330Z 01006KT 9999 SCT015 BKN040 27/23 Q1012 NOSIG=\n"
+                "...\n"
+                "仍然按 '=' 作为每条报文结束。"
+            ),
+        )
+        submitted = st.form_submit_button("解析并保存所有报文")
+
+    if submitted:
         text = raw_block.strip()
         if not text:
             st.warning("请先输入报文")
             return
 
-        parts = text.split("=")
-        count = 0
-        for p in parts:
-            t = p.strip()
-            if not t:
-                continue
-            one_line = " ".join(t.split())
-            rec = parse_metar(one_line)
-            insert_metar(rec)
-            count += 1
+        recs = [parse_metar(one_line) for one_line in _iter_metars(text)]
 
-        st.success(f"✅ 共解析并保存 {count} 条报文")
+        insert_metars_bulk(recs)
+        cached_get_recent_metars.clear()
+        st.success(f"✅ 共解析并保存 {len(recs)} 条报文")
 
     st.markdown("---")
     st.subheader("📑 最近 METAR 解析记录")
 
-    rows = get_recent_metars(limit=200)
+    rows = cached_get_recent_metars(limit=200)
     if not rows:
         st.info("暂无记录")
         return
 
-    df = pd.DataFrame(
+    df = pd.DataFrame.from_records(
         rows,
         columns=[
             "UTC时间",
@@ -168,22 +239,7 @@ def page_metar():
         ],
     )
 
-    # 越南时间 UTC+7
-    def to_vn(t):
-        if not isinstance(t, str):
-            return ""
-        m = re.match(r"(\d{2})(\d{2})(\d{2})Z", t)
-        if not m:
-            return ""
-        dd, hh, mm = int(m.group(1)), int(m.group(2)), int(m.group(3))
-        hh2 = hh + 7
-        add = 0
-        if hh2 >= 24:
-            hh2 -= 24
-            add = 1
-        return f"{dd+add:02d}日 {hh2:02d}:{mm:02d}"
-
-    df.insert(1, "越南时间(UTC+7)", df["UTC时间"].apply(to_vn))
+    df.insert(1, "越南时间(UTC+7)", utc_to_vn(df["UTC时间"]))
 
     st.dataframe(df, use_container_width=True)
 
@@ -197,30 +253,33 @@ def page_rain_runway():
     # ---------- A. 降水节点记录 ----------
     st.subheader("A. 记录降水变化节点")
 
-    c1, c2 = st.columns(2)
-    with c1:
-        rain_date = st.date_input("降水日期", key="rain_date")
-    with c2:
-        rain_time_raw = st.text_input("时间（如1130,1201,1624）", key="rain_time")
+    with st.form("rain_form"):
+        c1, c2 = st.columns(2)
+        with c1:
+            rain_date = st.date_input("降水日期", key="rain_date")
+        with c2:
+            rain_time_raw = st.text_input("时间（如1130,1201,1624）", key="rain_time")
+
+        rain_level = st.selectbox(
+            "雨强",
+            ["毛毛雨", "小雨", "中雨", "大雨", "暴雨", "雷阵雨", "雨停"],
+            key="rain_level",
+        )
+        rain_code = st.text_input(
+            "对应报文代码（如 -RA、RA、+RA、TSRA 等，可选）", key="rain_code"
+        )
+        rain_note = st.text_input("备注（可选）", key="rain_note")
+        rain_submitted = st.form_submit_button("保存降水记录")
 
     rain_time_hhmm = parse_time_numeric(rain_time_raw)
     rain_time_str = f"{rain_date} {rain_time_hhmm}" if rain_time_hhmm else None
 
-    rain_level = st.selectbox(
-        "雨强",
-        ["毛毛雨", "小雨", "中雨", "大雨", "暴雨", "雷阵雨", "雨停"],
-        key="rain_level",
-    )
-    rain_code = st.text_input(
-        "对应报文代码（如 -RA、RA、+RA、TSRA 等，可选）", key="rain_code"
-    )
-    rain_note = st.text_input("备注（可选）", key="rain_note")
-
-    if st.button("保存降水记录"):
+    if rain_submitted:
         if not rain_time_str:
             st.error("时间格式错误，请输入类似 1130/1201/1624 的数字")
         else:
             insert_rain_event(rain_time_str, rain_level, rain_code, rain_note)
+            cached_get_rain_events.clear()
             st.success(f"✅ 已记录降水：{rain_time_str} — {rain_level}")
 
     st.markdown("---")
@@ -228,32 +287,35 @@ def page_rain_runway():
     # ---------- B. 跑道干湿状态记录 ----------
     st.subheader("B. 记录跑道干湿状态（与降水过程对应）")
 
-    r1, r2 = st.columns(2)
-    with r1:
-        rw_date = st.date_input("跑道状态日期", key="rw_date")
-    with r2:
-        rw_time_raw = st.text_input("时间（如1130,1201,1624）", key="rw_time")
+    with st.form("runway_form"):
+        r1, r2 = st.columns(2)
+        with r1:
+            rw_date = st.date_input("跑道状态日期", key="rw_date")
+        with r2:
+            rw_time_raw = st.text_input("时间（如1130,1201,1624）", key="rw_time")
+
+        rw_state = st.selectbox(
+            "跑道状态",
+            [
+                "跑道干",
+                "跑道大部湿（仍视为干跑道）",
+                "跑道湿",
+                "跑道恢复干",
+            ],
+            key="rw_state",
+        )
+        rw_note = st.text_input("跑道备注（可选，如 T/O 滑跑明显）", key="rw_note")
+        rw_submitted = st.form_submit_button("保存跑道状态记录")
 
     rw_time_hhmm = parse_time_numeric(rw_time_raw)
     rw_time_str = f"{rw_date} {rw_time_hhmm}" if rw_time_hhmm else None
 
-    rw_state = st.selectbox(
-        "跑道状态",
-        [
-            "跑道干",
-            "跑道大部湿（仍视为干跑道）",
-            "跑道湿",
-            "跑道恢复干",
-        ],
-        key="rw_state",
-    )
-    rw_note = st.text输入 = st.text_input("跑道备注（可选，如 T/O 滑跑明显）", key="rw_note")
-
-    if st.button("保存跑道状态记录"):
+    if rw_submitted:
         if not rw_time_str:
             st.error("时间格式错误，请输入类似 1130/1201/1624 的数字")
         else:
             insert_runway_state(rw_time_str, rw_state, rw_note)
+            cached_get_runway_states.clear()
             st.success(f"✅ 已记录跑道状态：{rw_time_str} — {rw_state}")
 
     st.markdown("---")
@@ -261,19 +323,20 @@ def page_rain_runway():
     # ---------- C. 历史降水 & 跑道查询 + 时间轴 ----------
     st.subheader("C. 历史降水 & 跑道状态查询（含时间轴）")
 
-    q1, q2 = st.columns(2)
-    with q1:
-        start = st.date_input("开始日期", key="his_start")
-    with q2:
-        end = st.date_input("结束日期", key="his_end")
+    with st.form("rain_runway_query_form"):
+        q1, q2 = st.columns(2)
+        with q1:
+            start = st.date_input("开始日期", key="his_start")
+        with q2:
+            end = st.date_input("结束日期", key="his_end")
+        queried = st.form_submit_button("查询降水 & 跑道历史")
 
-    if st.button("查询降水 & 跑道历史"):
+    if queried:
         # 降水
-        rain_rows = get_rain_events(str(start), str(end))
+        rain_rows = cached_get_rain_events(str(start), str(end))
         if rain_rows:
             df_rain = pd.DataFrame(rain_rows, columns=["时间", "雨强", "报文代码", "备注"])
-            df_rain["时间"] = pd.to_datetime(df_rain["时间"])
-            df_rain = df_rain.sort_values("时间")
+            df_rain["时间"] = pd.to_datetime(df_rain["时间"], format=TIME_FMT, cache=True)
             st.subheader("📑 降水记录")
             st.dataframe(df_rain, use_container_width=True)
         else:
@@ -281,11 +344,10 @@ def page_rain_runway():
             st.info("该时间段无降水记录")
 
         # 跑道
-        rw_rows = get_runway_states(str(start), str(end))
+        rw_rows = cached_get_runway_states(str(start), str(end))
         if rw_rows:
             df_rw = pd.DataFrame(rw_rows, columns=["时间", "跑道状态", "备注"])
-            df_rw["时间"] = pd.to_datetime(df_rw["时间"])
-            df_rw = df_rw.sort_values("时间")
+            df_rw["时间"] = pd.to_datetime(df_rw["时间"], format=TIME_FMT, cache=True)
             st.subheader("📑 跑道干湿状态记录")
             st.dataframe(df_rw, use_container_width=True)
         else:
@@ -295,10 +357,11 @@ def page_rain_runway():
         # ① 整体时间轴
         if not df_rain.empty or not df_rw.empty:
             st.subheader("🕒 降水 & 跑道干湿状态时间轴（整体）")
-            fig_all = plot_rain_runway_timeline(df_rain, df_rw)
-            st.pyplot(fig_all)
+            st.image(cached_timeline_png(df_rain, df_rw), width="stretch")
 
             # ② 按“湿跑道过程”拆分，多张图展示
+            from rain_analysis_V4 import split_wet_runway_episodes
+
             episodes = split_wet_runway_episodes(df_rain, df_rw)
             if episodes:
                 st.subheader("🌧 各次湿跑道过程（分图显示）")
@@ -306,8 +369,8 @@ def page_rain_runway():
                     start_t = ep["start"].strftime("%Y-%m-%d %H:%M") if ep["start"] else "?"
                     end_t = ep["end"].strftime("%H:%M") if ep["end"] else "?"
                     st.markdown(f"**湿跑道过程 {idx}：{start_t} ~ {end_t}**")
-                    fig_ep = plot_rain_runway_timeline(ep["rain_df"], ep["runway_df"])
-                    st.pyplot(fig_ep)
+                    png_ep = cached_timeline_png(ep["rain_df"], ep["runway_df"])
+                    st.image(png_ep, width="stretch")
             else:
                 st.info("尚未形成完整的湿跑道过程（可能缺少“跑道恢复干”的记录）。")
         else:
@@ -320,29 +383,30 @@ def page_rain_runway():
 def page_rain_analysis():
     st.header("📘 自动降水事件分析")
 
-    a1, a2 = st.columns(2)
-    with a1:
-        start = st.date_input("开始日期", key="ana_start")
-    with a2:
-        end = st.date_input("结束日期", key="ana_end")
+    with st.form("rain_analysis_form"):
+        a1, a2 = st.columns(2)
+        with a1:
+            start = st.date_input("开始日期", key="ana_start")
+        with a2:
+            end = st.date_input("结束日期", key="ana_end")
+        queried = st.form_submit_button("生成降水事件分析")
 
-    if st.button("生成降水事件分析"):
-        rows = get_rain_events(str(start), str(end))
+    if queried:
+        rows = cached_get_rain_events(str(start), str(end))
         if not rows:
             st.info("该时间段无降水记录")
             return
 
         df = pd.DataFrame(rows, columns=["时间", "雨强", "代码", "备注"])
-        df["时间"] = pd.to_datetime(df["时间"])
-        events = analyze_rain_events(df)
+        df["时间"] = pd.to_datetime(df["时间"], format=TIME_FMT, cache=True)
+        reports, png = cached_rain_analysis(df)
 
         st.subheader("📝 降水事件文本报告")
-        for ev in events:
-            st.markdown(ev["report"])
+        for report in reports:
+            st.markdown(report)
 
         st.subheader("📈 降水事件强度随时间变化")
-        fig = plot_rain_events(events)
-        st.pyplot(fig)
+        st.image(png, width="stretch")
 
 
 # ============================================================
@@ -1,24 +1,54 @@
 # db_V4.py —— 昆岛机场气象&跑道记录系统 V4 数据库模块
 
 import sqlite3
+import threading
 from contextlib import contextmanager
 
 DB_NAME = "kunda.db"
 
+# 单机单写入的 Streamlit 应用，不需要每次提交都完整 fsync
+# （synchronous 等是连接级设置，每个连接都要设）
+_CONN_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+)
+
+
+# 进程内共用一个连接，避免每次查询都重新 connect / 设 PRAGMA。
+# Streamlit 每个会话跑在不同线程里，用锁串行化对连接的访问。
+_conn = None
+_conn_lock = threading.RLock()
+
+
+def _connect():
+    conn = sqlite3.connect(DB_NAME, check_same_thread=False)
+    for pragma in _CONN_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
 
 @contextmanager
 def get_conn():
-    conn = sqlite3.connect(DB_NAME, check_same_thread=False)
-    try:
-        yield conn
-    finally:
-        conn.close()
+    global _conn
+    with _conn_lock:
+        if _conn is None:
+            _conn = _connect()
+        try:
+            yield _conn
+        except Exception:
+            # 出错时不要把半截事务留在共享连接上
+            _conn.rollback()
+            raise
 
 
 def init_db():
     with get_conn() as conn:
         c = conn.cursor()
 
+        # WAL 模式写入数据库文件本身，设一次即可
+        c.execute("PRAGMA journal_mode=WAL")
+
         # 预报表
         c.execute(
             """
@@ -89,6 +119,14 @@ def init_db():
             """
         )
 
+        # 查询用到的时间列索引：BETWEEN / ORDER BY 走索引范围扫描
+        c.execute("CREATE INDEX IF NOT EXISTS idx_forecast_date ON forecasts(date)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_metar_created ON metars(created_at)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_rain_start ON rain_events(start_time)")
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS idx_runway_time ON runway_states(event_time)"
+        )
+
         conn.commit()
 
 
@@ -120,7 +158,21 @@ def get_forecasts(start_date, end_date):
 
 
 # ---------------- METAR ----------------
-def insert_metar(rec):
+_METAR_INSERT_SQL = """
+    INSERT INTO metars (
+        obs_time, station, raw,
+        wind_dir, wind_speed, wind_gust,
+        visibility, temp, dewpoint,
+        weather, rain_flag, rain_level_cn,
+        cloud_1_amount, cloud_1_height_m,
+        cloud_2_amount, cloud_2_height_m,
+        cloud_3_amount, cloud_3_height_m
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _metar_row(rec):
     station = rec["station"]
     obs = rec["obs_time"]
     raw = rec["raw"]
@@ -147,42 +199,43 @@ def insert_metar(rec):
     c2, h2 = cl(1)
     c3, h3 = cl(2)
 
+    return (
+        obs,
+        station,
+        raw,
+        wind_dir,
+        wind_speed,
+        wind_gust,
+        vis,
+        temp,
+        dew,
+        weather_text,
+        rain_flag,
+        rain_level,
+        c1,
+        h1,
+        c2,
+        h2,
+        c3,
+        h3,
+    )
+
+
+def insert_metar(rec):
     with get_conn() as conn:
         c = conn.cursor()
-        c.execute(
-            """
-            INSERT INTO metars (
-                obs_time, station, raw,
-                wind_dir, wind_speed, wind_gust,
-                visibility, temp, dewpoint,
-                weather, rain_flag, rain_level_cn,
-                cloud_1_amount, cloud_1_height_m,
-                cloud_2_amount, cloud_2_height_m,
-                cloud_3_amount, cloud_3_height_m
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                obs,
-                station,
-                raw,
-                wind_dir,
-                wind_speed,
-                wind_gust,
-                vis,
-                temp,
-                dew,
-                weather_text,
-                rain_flag,
-                rain_level,
-                c1,
-                h1,
-                c2,
-                h2,
-                c3,
-                h3,
-            ),
-        )
+        c.execute(_METAR_INSERT_SQL, _metar_row(rec))
+        conn.commit()
+
+
+# 粘贴多条报文时用：一次连接、一次提交写入全部
+def insert_metars_bulk(recs):
+    rows = [_metar_row(rec) for rec in recs]
+    if not rows:
+        return
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.executemany(_METAR_INSERT_SQL, rows)
         conn.commit()
 
 
@@ -227,7 +280,7 @@ def get_rain_events(start_date, end_date):
             """
             SELECT start_time, rain_level_cn, rain_code, note
             FROM rain_events
-            WHERE date(start_time) BETWEEN ? AND ?
+            WHERE start_time >= ? AND start_time < date(?, '+1 day')
             ORDER BY start_time
             """,
             (start_date, end_date),
@@ -242,7 +295,7 @@ def get_rain_stats_by_day(start_date, end_date):
             """
             SELECT date(start_time), COUNT(*)
             FROM rain_events
-            WHERE date(start_time) BETWEEN ? AND ?
+            WHERE start_time >= ? AND start_time < date(?, '+1 day')
             GROUP BY date(start_time)
             ORDER BY date(start_time)
             """,
@@ -270,7 +323,7 @@ def get_runway_states(start_date, end_date):
             """
             SELECT event_time, state, note
             FROM runway_states
-            WHERE date(event_time) BETWEEN ? AND ?
+            WHERE event_time >= ? AND event_time < date(?, '+1 day')
             ORDER BY event_time
             """,
             (start_date, end_date),
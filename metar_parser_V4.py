@@ -2,15 +2,61 @@
 # 支持 Rx + METAR 多行报文，支持等号结束格式
 # 不依赖数据库
 
+import functools
 import re
 
+# ================== 预编译正则（模块导入时编译一次） ==================
+_RE_STATION = re.compile(r"\bMETAR\s+([A-Z]{4})\b")
+_RE_STATION_FALLBACK = re.compile(r"\b([A-Z]{4})\b")
+_RE_TIME = re.compile(r"\b(\d{6})Z\b")
+_RE_WIND = re.compile(r"(VRB|\d{3})(\d{2,3})(?:G(\d{2,3}))?KT")
+_RE_VIS = re.compile(r"\b(\d{4})\b")
+_RE_TEMP = re.compile(r"\b(M?\d{2})/(M?\d{2})\b")
+_RE_CLOUD = re.compile(r"(FEW|SCT|BKN|OVC)(\d{3})")
+
+# 短于此长度的文本不当作报文解析
+_MIN_REPORT_LEN = 10
+
+# ================== 天气现象 ==================
+WEATHER_PATTERNS = {
+    r"\+SHRA": ("大阵雨", True, "大雨"),
+    r"\-SHRA": ("小阵雨", True, "小雨"),
+    r"\bSHRA\b": ("中阵雨", True, "中雨"),
+    r"\+RA\b": ("大雨", True, "大雨"),
+    r"\-RA\b": ("小雨", True, "小雨"),
+    r"\bRA\b": ("中雨", True, "中雨"),
+    r"TSRA": ("雷雨", True, "雷阵雨"),
+    r"\bTS\b": ("雷暴", False, None),
+    r"\bDZ\b": ("毛毛雨", True, "小雨"),
+    r"\bFG\b": ("雾", False, None),
+    r"\bBR\b": ("薄雾", False, None),
+    r"\bHZ\b": ("霾", False, None),
+}
+
+_WEATHER_COMPILED = [
+    (re.compile(p), desc, israin, lvl)
+    for p, (desc, israin, lvl) in WEATHER_PATTERNS.items()
+]
+
 
 def parse_metar(text: str):
     text = text.strip()
     # 报文可能被换行分行，统一成一行
     text = " ".join(text.split())
 
-    result = {
+    # 光站号 + 时间组就有 12 个字符，更短的只可能是空行/残片，不必跑正则
+    if len(text) < _MIN_REPORT_LEN:
+        return _empty_result(text)
+
+    # 缓存里存的是不可变结果，这里还原成普通 dict / list，调用方随便改
+    result = dict(_parse_metar_impl(text))
+    result["weather"] = list(result["weather"])
+    result["clouds"] = [dict(c) for c in result["clouds"]]
+    return result
+
+
+def _empty_result(text: str):
+    return {
         "raw": text,
         "station": None,
         "obs_time": None,
@@ -26,24 +72,30 @@ def parse_metar(text: str):
         "clouds": [],
     }
 
+
+# 同一条报文经常被重复粘贴，按规范化后的原文缓存解析结果
+@functools.lru_cache(maxsize=4096)
+def _parse_metar_impl(text: str):
+    result = _empty_result(text)
+
     # ================== 站号识别 ==================
     # 优先模式：METAR XXXX
-    m_sta = re.search(r"\bMETAR\s+([A-Z]{4})\b", text)
+    m_sta = _RE_STATION.search(text)
     if m_sta:
         result["station"] = m_sta.group(1)
     else:
         # 备用模式：找到第一个 4 字母大写段
-        m_sta2 = re.search(r"\b([A-Z]{4})\b", text)
+        m_sta2 = _RE_STATION_FALLBACK.search(text)
         if m_sta2:
             result["station"] = m_sta2.group(1)
 
     # ================== 报文时间（取最后一个） ==================
-    times = re.findall(r"\b(\d{6})Z\b", text)
+    times = _RE_TIME.findall(text)
     if times:
         result["obs_time"] = times[-1] + "Z"
 
     # ================== 风 ==================
-    wind_match = re.search(r"(VRB|\d{3})(\d{2,3})(?:G(\d{2,3}))?KT", text)
+    wind_match = _RE_WIND.search(text)
     if wind_match:
         d = wind_match.group(1)
         if d != "VRB":
@@ -53,12 +105,12 @@ def parse_metar(text: str):
             result["wind_gust"] = int(wind_match.group(3))
 
     # ================== 能见度 ==================
-    vis_match = re.search(r"\b(\d{4})\b", text)
+    vis_match = _RE_VIS.search(text)
     if vis_match:
         result["visibility"] = int(vis_match.group(1))
 
     # ================== 温度 / 露点 ==================
-    temp_match = re.search(r"\b(M?\d{2})/(M?\d{2})\b", text)
+    temp_match = _RE_TEMP.search(text)
     if temp_match:
         t = temp_match.group(1)
         d = temp_match.group(2)
@@ -66,34 +118,21 @@ def parse_metar(text: str):
         result["dewpoint"] = -int(d[1:]) if d.startswith("M") else int(d)
 
     # ================== 云（ft → m） ==================
-    cloud_matches = re.findall(r"(FEW|SCT|BKN|OVC)(\d{3})", text)
+    cloud_matches = _RE_CLOUD.findall(text)
     for amt, h in cloud_matches:
         ft = int(h) * 100
         m_height = round(ft * 0.3048)
         result["clouds"].append({"amount": amt, "height_m": m_height})
 
     # ================== 天气现象 ==================
-    WEATHER_PATTERNS = {
-        r"\+SHRA": ("大阵雨", True, "大雨"),
-        r"\-SHRA": ("小阵雨", True, "小雨"),
-        r"\bSHRA\b": ("中阵雨", True, "中雨"),
-        r"\+RA\b": ("大雨", True, "大雨"),
-        r"\-RA\b": ("小雨", True, "小雨"),
-        r"\bRA\b": ("中雨", True, "中雨"),
-        r"TSRA": ("雷雨", True, "雷阵雨"),
-        r"\bTS\b": ("雷暴", False, None),
-        r"\bDZ\b": ("毛毛雨", True, "小雨"),
-        r"\bFG\b": ("雾", False, None),
-        r"\bBR\b": ("薄雾", False, None),
-        r"\bHZ\b": ("霾", False, None),
-    }
-
-    for pattern, (desc, israin, rainlevel) in WEATHER_PATTERNS.items():
-        if re.search(pattern, text):
+    for pattern, desc, israin, rainlevel in _WEATHER_COMPILED:
+        if pattern.search(text):
             result["weather"].append(desc)
             if israin:
                 result["is_raining"] = True
                 if result["rain_type"] is None:
                     result["rain_type"] = rainlevel
 
-    return result
+    result["weather"] = tuple(result["weather"])
+    result["clouds"] = tuple(tuple(c.items()) for c in result["clouds"])
+    return tuple(result.items())
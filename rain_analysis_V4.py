@@ -5,28 +5,47 @@
 #   plot_rain_runway_timeline：降水 & 跑道干湿时间轴
 #   split_wet_runway_episodes：按“湿跑道过程”拆成多段（给多张图用）
 
+import functools
 import os
+import subprocess
+from io import BytesIO
 from urllib.request import urlopen
 
+import matplotlib
+
+matplotlib.use("Agg")  # 服务端只出图片，不需要交互式后端
+
+import matplotlib.dates as mdates
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
+from matplotlib.collections import LineCollection
 from matplotlib.font_manager import FontProperties, fontManager
+from matplotlib.lines import Line2D
 
 # ================================
 # 自动获取中文字体（优先下载 Noto Sans SC）
 # ================================
-FONT_CACHE_PATH = "/tmp/NotoSansSC-Regular.otf"
+# 放在用户缓存目录（XDG_CACHE_HOME，默认 ~/.cache），不随 /tmp 清理丢失
+FONT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+    "cno-weather",
+)
+FONT_CACHE_PATH = os.path.join(FONT_CACHE_DIR, "NotoSansSC-Regular.otf")
 FONT_URL = (
     "https://github.com/googlefonts/noto-cjk/raw/main/Sans/OTF/"
     "SimplifiedChinese/NotoSansSC-Regular.otf"
 )
 
 
+@functools.lru_cache(maxsize=1)
 def get_chinese_font():
     """
-    优先使用 /tmp 下缓存的 Noto Sans SC；
-    若不存在则尝试从 GitHub 下载；
-    如果下载失败，再去系统字体里摸一个常见的中文字体；
+    第一次画图时才调用（结果缓存，进程内只找一次）：
+    优先使用缓存目录里的 Noto Sans SC；
+    没有缓存就先问 fontconfig 系统里有没有中文字体（不走网络）；
+    再不行尝试从 GitHub 下载；
+    如果下载失败，再去 matplotlib 已知的系统字体里摸一个常见的中文字体；
     实在不行就返回 None（中文会变方块，但程序不会崩）。
     """
     # 1) 之前已经下载过，直接用缓存
@@ -36,17 +55,34 @@ def get_chinese_font():
         except Exception:
             pass
 
-    # 2) 尝试从网上下载 Noto Sans SC
+    # 2) fontconfig 列出支持中文的字体文件
+    try:
+        out = subprocess.check_output(
+            ["fc-list", ":lang=zh", "-f", "%{file}\n"],
+            timeout=2,
+            text=True,
+        )
+        for path in out.splitlines():
+            if path and os.path.exists(path):
+                return FontProperties(fname=path)
+    except Exception:
+        pass  # 没装 fontconfig 或没有中文字体
+
+    # 3) 尝试从网上下载 Noto Sans SC
+    #    先写临时文件再改名，下载中断也不会留下半截的缓存
     try:
         with urlopen(FONT_URL, timeout=10) as r:
             data = r.read()
-        with open(FONT_CACHE_PATH, "wb") as f:
+        os.makedirs(FONT_CACHE_DIR, exist_ok=True)
+        tmp_path = FONT_CACHE_PATH + ".part"
+        with open(tmp_path, "wb") as f:
             f.write(data)
+        os.replace(tmp_path, FONT_CACHE_PATH)
         return FontProperties(fname=FONT_CACHE_PATH)
     except Exception:
         pass  # 下载失败就继续往下走
 
-    # 3) 在系统字体里找常见中文字体
+    # 4) 在系统字体里找常见中文字体
     try:
         prefer_names = [
             "SimHei",
@@ -61,22 +97,30 @@ def get_chinese_font():
     except Exception:
         pass
 
-    # 4) 实在没办法
+    # 5) 实在没办法
     return None
 
 
-CH_FONT = get_chinese_font()
+@functools.lru_cache(maxsize=1)
+def _setup_font():
+    """
+    第一次画图前调用：把中文字体注册进 matplotlib 并设为全局字体，
+    之后所有文字直接用 rcParams，不必每次 ax.text 都传 fontproperties。
+    """
+    ch_font = get_chinese_font()
+    if ch_font is not None:
+        try:
+            fontManager.addfont(ch_font.get_file())
+            plt.rcParams["font.family"] = ch_font.get_name()
+            return
+        except Exception:
+            pass
 
-if CH_FONT is not None:
-    plt.rcParams["font.family"] = CH_FONT.get_name()
-else:
     # 没找到中文字体，就用默认英文字体（中文还是会是方块）
     plt.rcParams["font.family"] = "DejaVu Sans"
 
-plt.rcParams["axes.unicode_minus"] = False  # 负号不乱码
 
-# 给 ax.text / ax.set_title 等用的统一参数
-TEXT_KW = {"fontproperties": CH_FONT} if CH_FONT is not None else {}
+plt.rcParams["axes.unicode_minus"] = False  # 负号不乱码
 
 # ================================
 # 雨强 → 数值映射
@@ -91,14 +135,40 @@ RAIN_LEVEL_MAP = {
     "雷阵雨": 3.5,
 }
 
+# 同一映射的数组版：按分类编码直接取值。
+# 末尾多放一个 NaN，未知雨强（编码 -1）正好取到它，和 dict.map 的结果一致
+_RAIN_CATEGORIES = pd.Index(list(RAIN_LEVEL_MAP))
+_RAIN_STRENGTH = np.array(
+    [RAIN_LEVEL_MAP[c] for c in _RAIN_CATEGORIES] + [np.nan], dtype=np.float32
+)
+
+
+def to_levels(series) -> np.ndarray:
+    """雨强列 → 强度数值数组（float32），整列一次查表"""
+    return _RAIN_STRENGTH[_RAIN_CATEGORIES.get_indexer(series)]
+
+
+# 单个降水事件的文本报告模板
+_EVENT_REPORT = (
+    "\n"
+    "### 【降水事件】\n"
+    "- 时间：%s — %s（约 %d 分钟）\n"
+    "- 过程：%s\n"
+    "- 最强雨强：%s\n"
+)
+
 
 # ---------------- 工具函数：跑道状态是否“干/湿” ----------------
+_DRY_STATES = frozenset(("跑道干", "跑道恢复干"))
+_WET_STATES = frozenset(("跑道湿", "跑道大部湿（仍视为干跑道）"))
+
+
 def is_runway_dry_state(state: str) -> bool:
-    return state in ["跑道干", "跑道恢复干"]
+    return state in _DRY_STATES
 
 
 def is_runway_wet_state(state: str) -> bool:
-    return state in ["跑道湿", "跑道大部湿（仍视为干跑道）"]
+    return state in _WET_STATES
 
 
 # ---------------------------------------------------------
@@ -110,87 +180,131 @@ def analyze_rain_events(df: pd.DataFrame):
       - 时间（datetime64）
       - 雨强（小雨/中雨/.../雨停）
     """
-    df = df.copy()
-    df["强度"] = df["雨强"].map(RAIN_LEVEL_MAP)
-    df = df.sort_values("时间")
+    # 只取用到的两列再排序：新建的小表不会改动调用方的 df，不必先整表 copy。
+    # 时间统一成 datetime64（已经是的话不会重新解析）
+    df = pd.DataFrame(
+        {"时间": pd.to_datetime(df["时间"], cache=True), "雨强": df["雨强"]}
+    ).sort_values("时间", ignore_index=True)
+    if df.empty:
+        return []
 
-    events = []
-    current = []
+    # 各列只取一次成列表，一遍扫描：遇到“雨停”结束当前事件，
+    # 末尾如果没遇到“雨停”，也算一次事件。
+    # 未知雨强（NaN）按 -1 参与比较，不会被选成最强雨强
+    times = df["时间"].tolist()
+    rains = df["雨强"].tolist()
+    levels = np.nan_to_num(to_levels(df["雨强"]), nan=-1.0).tolist()
+    last = len(rains) - 1
 
-    for _, row in df.iterrows():
-        if row["雨强"] != "雨停":
-            current.append(row)
-        else:
-            # 雨停作为一个事件的结束
-            current.append(row)
-            events.append(current)
-            current = []
-
-    # 末尾如果没遇到“雨停”，也算一次事件
-    if current:
-        events.append(current)
+    events = []
+    start = 0
+    for i, rain in enumerate(rains):
+        if rain != "雨停" and i != last:
+            continue
+        top = max(range(start, i + 1), key=levels.__getitem__)
+        report = _EVENT_REPORT % (
+            times[start].strftime("%Y-%m-%d %H:%M"),
+            times[i].strftime("%H:%M"),
+            int((times[i] - times[start]).total_seconds() / 60),
+            " → ".join(rains[start : i + 1]),
+            rains[top],
+        )
+        events.append({"records": df.iloc[start : i + 1], "report": report})
+        start = i + 1
 
-    return [format_event(ev) for ev in events]
+    return events
 
 
 # ---------------------------------------------------------
-# 格式化单个降水事件
+# 图 → PNG 字节（便于缓存；渲染完立即关闭 figure，避免反复运行时内存累积）
 # ---------------------------------------------------------
-def format_event(records):
-    times = [r["时间"] for r in records]
-    rains = [r["雨强"] for r in records]
-    strengths = [RAIN_LEVEL_MAP[r] for r in rains]
-
-    start = times[0]
-    end = times[-1]
-    duration = (end - start).total_seconds() / 60
-    max_rain = rains[strengths.index(max(strengths))]
-    process = " → ".join(rains)
-
-    report = f"""
-### 【降水事件】
-- 时间：{start.strftime('%Y-%m-%d %H:%M')} — {end.strftime('%H:%M')}（约 {int(duration)} 分钟）
-- 过程：{process}
-- 最强雨强：{max_rain}
-"""
-
-    return {"records": records, "report": report}
+def fig_to_png(fig, dpi=200):
+    buf = BytesIO()
+    fig.savefig(buf, format="png", dpi=dpi, bbox_inches="tight")
+    plt.close(fig)
+    return buf.getvalue()
 
 
 # ---------------------------------------------------------
 # 降水事件强度随时间图
 # ---------------------------------------------------------
 def plot_rain_events(events):
+    _setup_font()
     fig, ax = plt.subplots(figsize=(12, 5))
 
     colors = ["blue", "orange", "green", "red", "purple", "brown", "cyan"]
 
+    # 所有事件的折线放进一个 LineCollection、所有点放进一次 scatter，
+    # 图例用不参与绘制的代理线条
+    segments = []
+    line_colors = []
+    all_times = []
+    all_vals = []
+    point_colors = []
+    handles = []
     for idx, ev in enumerate(events):
         records = ev["records"]
-        times = [r["时间"] for r in records]
-        vals = [RAIN_LEVEL_MAP[r["雨强"]] for r in records]
+        times = records["时间"].to_numpy()
+        vals = to_levels(records["雨强"])
+        color = colors[idx % len(colors)]
+
+        segments.append(np.column_stack([mdates.date2num(times), vals]))
+        line_colors.append(color)
+        all_times.append(times)
+        all_vals.append(vals)
+        point_colors.extend([color] * len(vals))
+        handles.append(
+            Line2D(
+                [],
+                [],
+                marker="o",
+                linewidth=2,
+                markersize=7,
+                color=color,
+                label=f"事件 {idx+1}",
+            )
+        )
 
-        ax.plot(
-            times,
-            vals,
-            marker="o",
-            linewidth=2,
-            markersize=7,
-            color=colors[idx % len(colors)],
-            label=f"事件 {idx+1}",
+    if events:
+        # 先画散点：datetime64 横轴让坐标轴按日期显示，折线用同一套数值坐标
+        ax.scatter(
+            np.concatenate(all_times),
+            np.concatenate(all_vals),
+            c=point_colors,
+            s=49,
+            zorder=3,
         )
+        ax.add_collection(LineCollection(segments, colors=line_colors, linewidths=2))
+        ax.autoscale_view()
 
-    ax.set_ylabel("降水强度等级", fontsize=12, **TEXT_KW)
-    ax.set_title("降水事件强度随时间变化", fontsize=14, **TEXT_KW)
+    ax.set_ylabel("降水强度等级", fontsize=12)
+    ax.set_title("降水事件强度随时间变化", fontsize=14)
 
     ax.grid(True, linestyle="--", alpha=0.6)
     plt.xticks(rotation=45, ha="right")
-    ax.legend()
+    ax.legend(handles=handles)
     plt.tight_layout()
 
     return fig
 
 
+# ---------------------------------------------------------
+# 时间轴上的一行：散点 + 文字标注
+# 列只取一次成数组，文字参数在循环外准备好；
+# 连续重复的标注（如一串“跑道湿”）只在第一次出现时标一次
+# ---------------------------------------------------------
+def _plot_labeled_row(ax, times, labels, y, dy, marker, label, ha, va):
+    ts = times.to_numpy()
+    texts = labels.to_numpy()
+
+    ax.scatter(ts, np.full(len(ts), float(y)), marker=marker, s=60, label=label)
+
+    keep = np.concatenate([[True], texts[1:] != texts[:-1]])
+    label_kw = {"rotation": 45, "ha": ha, "va": va, "fontsize": 8}
+    for t, text in zip(ts[keep], texts[keep]):
+        ax.text(t, y + dy, text, **label_kw)
+
+
 # ---------------------------------------------------------
 # 降水 + 跑道状态 时间轴（整体用）
 # ---------------------------------------------------------
@@ -199,56 +313,43 @@ def plot_rain_runway_timeline(rain_df: pd.DataFrame, runway_df: pd.DataFrame):
     rain_df: DataFrame，列至少包含 ["时间","雨强"]
     runway_df: DataFrame，列至少包含 ["时间","跑道状态"]
     """
+    _setup_font()
     fig, ax = plt.subplots(figsize=(12, 4))
 
     # 降水：y = 1
     if rain_df is not None and not rain_df.empty:
-        ax.scatter(
+        _plot_labeled_row(
+            ax,
             rain_df["时间"],
-            [1] * len(rain_df),
+            rain_df["雨强"],
+            y=1,
+            dy=0.05,
             marker="o",
-            s=60,
             label="降水",
+            ha="left",
+            va="bottom",
         )
-        for t, label in zip(rain_df["时间"], rain_df["雨强"]):
-            ax.text(
-                t,
-                1.05,
-                label,
-                rotation=45,
-                ha="left",
-                va="bottom",
-                fontsize=8,
-                **TEXT_KW,
-            )
 
     # 跑道：y = 0
     if runway_df is not None and not runway_df.empty:
-        ax.scatter(
+        _plot_labeled_row(
+            ax,
             runway_df["时间"],
-            [0] * len(runway_df),
+            runway_df["跑道状态"],
+            y=0,
+            dy=-0.05,
             marker="s",
-            s=60,
             label="跑道状态",
+            ha="right",
+            va="top",
         )
-        for t, label in zip(runway_df["时间"], runway_df["跑道状态"]):
-            ax.text(
-                t,
-                -0.05,
-                label,
-                rotation=45,
-                ha="right",
-                va="top",
-                fontsize=8,
-                **TEXT_KW,
-            )
 
     ax.set_yticks([0, 1])
-    ax.set_yticklabels(["跑道状态", "降水"], fontsize=11, **TEXT_KW)
+    ax.set_yticklabels(["跑道状态", "降水"], fontsize=11)
     ax.set_ylim(-0.6, 1.6)
 
-    ax.set_xlabel("时间", fontsize=12, **TEXT_KW)
-    ax.set_title("降水与跑道干湿状态时间轴", fontsize=14, **TEXT_KW)
+    ax.set_xlabel("时间", fontsize=12)
+    ax.set_title("降水与跑道干湿状态时间轴", fontsize=14)
 
     ax.grid(True, axis="x", linestyle="--", alpha=0.5)
     plt.xticks(rotation=45, ha="right")
@@ -257,6 +358,15 @@ def plot_rain_runway_timeline(rain_df: pd.DataFrame, runway_df: pd.DataFrame):
     return fig
 
 
+# 过程里没有某类记录时共用的空表（各过程的表下游只读，不会原地修改）
+_EMPTY_RAIN = pd.DataFrame(
+    {"时间": pd.Series(dtype="datetime64[ns]"), "雨强": pd.Series(dtype="object")}
+)
+_EMPTY_RUNWAY = pd.DataFrame(
+    {"时间": pd.Series(dtype="datetime64[ns]"), "跑道状态": pd.Series(dtype="object")}
+)
+
+
 # ---------------------------------------------------------
 # 按“湿跑道过程”拆分成多段
 # 规则：
@@ -273,116 +383,78 @@ def split_wet_runway_episodes(
     ):
         return []
 
-    # 拷贝 & 排序
-    r_df = rain_df.copy()
-    rw_df = runway_df.copy()
-    r_df = r_df.sort_values("时间")
-    rw_df = rw_df.sort_values("时间")
-
-    events = []
-
-    # 合并时间线：kind = rain / runway
-    for _, r in r_df.iterrows():
-        events.append({"时间": r["时间"], "kind": "rain", "雨强": r["雨强"]})
-    for _, r in rw_df.iterrows():
-        events.append(
-            {
-                "时间": r["时间"],
-                "kind": "runway",
-                "跑道状态": r["跑道状态"],
-            }
-        )
-
-    timeline = pd.DataFrame(events).sort_values("时间")
+    # 合并时间线：两边先统一成 datetime64[ns]，再按 int64 纳秒稳定排序
+    # （同一时刻降水在前）
+    rt = pd.to_datetime(rain_df["时间"], cache=True).to_numpy(
+        dtype="datetime64[ns]"
+    )
+    wt = pd.to_datetime(runway_df["时间"], cache=True).to_numpy(
+        dtype="datetime64[ns]"
+    )
+    times = np.concatenate([rt, wt])
+    values = np.concatenate(
+        [rain_df["雨强"].to_numpy(), runway_df["跑道状态"].to_numpy()]
+    )
+    is_rain = np.concatenate(
+        [np.ones(len(rt), dtype=bool), np.zeros(len(wt), dtype=bool)]
+    )
+
+    order = np.argsort(times.view("int64"), kind="stable")
+    times = times[order]
+    values = values[order]
+    is_rain = is_rain[order]
+
+    # 状态机只需要两个布尔标记：这条降水是否“有雨”、这条跑道状态是否“干”
+    rain_on = is_rain & (values != "雨停")
+    runway_dry = ~is_rain & pd.Series(values).isin(_DRY_STATES).to_numpy()
 
     episodes = []
-    in_episode = False
-    rain_records = []
-    runway_records = []
-    start_time = None
-    end_time = None
-
-    for _, ev in timeline.iterrows():
-        kind = ev["kind"]
-
-        # ===== 降水事件 =====
-        if kind == "rain":
-            level = ev["雨强"]
-            t = ev["时间"]
-
-            if level != "雨停":
-                # 有雨
-                if not in_episode:
-                    # 新开一个湿跑道过程
-                    in_episode = True
-                    rain_records = []
-                    runway_records = []
-                    start_time = t
-                rain_records.append({"时间": t, "雨强": level})
-                end_time = t
-            else:
-                # 雨停
-                if in_episode:
-                    rain_records.append({"时间": t, "雨强": level})
-                    end_time = t
-
-        # ===== 跑道事件 =====
+    for start, end in _scan_episodes(rain_on.tolist(), runway_dry.tolist()):
+        sl = slice(start, end + 1)
+        ep_times, ep_values, ep_is_rain = times[sl], values[sl], is_rain[sl]
+        ep_is_rw = ~ep_is_rain
+
+        if ep_is_rain.any():
+            ep_rain_df = pd.DataFrame(
+                {"时间": ep_times[ep_is_rain], "雨强": ep_values[ep_is_rain]}
+            )
+        else:
+            ep_rain_df = _EMPTY_RAIN
+        if ep_is_rw.any():
+            ep_rw_df = pd.DataFrame(
+                {"时间": ep_times[ep_is_rw], "跑道状态": ep_values[ep_is_rw]}
+            )
         else:
-            state = ev["跑道状态"]
-            t = ev["时间"]
-
-            if in_episode:
-                runway_records.append({"时间": t, "跑道状态": state})
-                end_time = t
-
-                if is_runway_dry_state(state):
-                    # 跑道恢复干 → 本次湿跑道过程结束
-                    ep_rain_df = (
-                        pd.DataFrame(rain_records)
-                        if rain_records
-                        else pd.DataFrame(columns=["时间", "雨强"])
-                    )
-                    ep_rw_df = (
-                        pd.DataFrame(runway_records)
-                        if runway_records
-                        else pd.DataFrame(columns=["时间", "跑道状态"])
-                    )
-                    episodes.append(
-                        {
-                            "start": start_time,
-                            "end": end_time,
-                            "rain_df": ep_rain_df,
-                            "runway_df": ep_rw_df,
-                        }
-                    )
-                    in_episode = False
-                    rain_records = []
-                    runway_records = []
-                    start_time = None
-                    end_time = None
-            else:
-                # 不在湿跑道过程中，跑道状态只作为背景，不计入任何过程
-                pass
+            ep_rw_df = _EMPTY_RUNWAY
 
-    # 如果最后还在过程里（还没恢复干），也输出一段
-    if in_episode and (rain_records or runway_records):
-        ep_rain_df = (
-            pd.DataFrame(rain_records)
-            if rain_records
-            else pd.DataFrame(columns=["时间", "雨强"])
-        )
-        ep_rw_df = (
-            pd.DataFrame(runway_records)
-            if runway_records
-            else pd.DataFrame(columns=["时间", "跑道状态"])
-        )
         episodes.append(
             {
-                "start": start_time,
-                "end": end_time,
+                "start": pd.Timestamp(times[start]),
+                "end": pd.Timestamp(times[end]),
                 "rain_df": ep_rain_df,
                 "runway_df": ep_rw_df,
             }
         )
 
     return episodes
+
+
+# 在合并后的时间线上跑状态机，返回每个湿跑道过程的 (起, 止) 下标（含两端）。
+# 过程内的降水、雨停、跑道记录全部计入，所以每个过程正好是时间线上连续的一段。
+def _scan_episodes(rain_on, runway_dry):
+    bounds = []
+    start = -1
+    for k in range(len(rain_on)):
+        if start < 0:
+            if rain_on[k]:
+                # 不在过程内时第一次“有雨” → 新开一个湿跑道过程
+                start = k
+        elif runway_dry[k]:
+            # 跑道恢复干 → 本次湿跑道过程结束
+            bounds.append((start, k))
+            start = -1
+
+    # 如果最后还在过程里（还没恢复干），也输出一段
+    if start >= 0:
+        bounds.append((start, len(rain_on) - 1))
+    return bounds